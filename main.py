@@ -198,42 +198,95 @@
 
 
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from bs4 import BeautifulSoup
-import requests
+import aiohttp
+import asyncio
+import functools
 import os
+import re
 import openai
 import logging
 import tldextract
-from urllib.parse import urljoin, urlparse
+import tiktoken
+from urllib.parse import urljoin, urlparse, urlunparse, urldefrag, urlencode, parse_qsl
+from collections import deque
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import csv
+import hashlib
+import json
 import io
 from google.cloud import storage
+from google.api_core.exceptions import NotFound
+from google.oauth2 import service_account
 import base64
-import tempfile
 import uvicorn
+from arq import create_pool
+from arq.connections import RedisSettings
 
 # Load environment variables
 load_dotenv()
 
-# Decode Google Cloud credentials
+# Decode Google Cloud credentials in memory (falls back to Application Default Credentials when unset)
 creds_b64 = os.getenv("GOOGLE_CREDS_B64")
+gcs_credentials = None
 if creds_b64:
-    with tempfile.NamedTemporaryFile(delete=False, mode='w') as temp_file:
-        temp_file.write(base64.b64decode(creds_b64).decode())
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file.name
+    gcs_credentials = service_account.Credentials.from_service_account_info(
+        json.loads(base64.b64decode(creds_b64))
+    )
 
-# OpenAI client setup
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI client setup (the client retries rate limits and transient errors with exponential backoff)
+client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=5)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("main")
 
+# Job queue: the API only enqueues scrapes, an arq worker process runs them
+REDIS_SETTINGS = RedisSettings.from_dsn(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.redis = await create_pool(REDIS_SETTINGS)
+    yield
+    await app.state.redis.aclose()
+
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Crawler and LLM limits
+CRAWL_CONCURRENCY = 50
+CRAWL_RETRIES = 3
+CRAWL_BACKOFF_SECONDS = 0.3
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico",
+    ".css", ".js", ".zip", ".mp3", ".mp4", ".xml",
+)
+LLM_CONCURRENCY = 10
+
+# OpenAI Batch API: half the token cost, results within the 24h completion window
+USE_BATCH_API = os.getenv("OPENAI_USE_BATCH", "false").lower() == "true"
+BATCH_POLL_SECONDS = 60
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+BATCH_TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# LLM input/output caps and content-addressed FAQ cache (GCS blobs keyed by model + page text)
+MAX_PROMPT_TOKENS = 3000
+MAX_COMPLETION_TOKENS = 1200
+FAQ_CACHE_PREFIX = "cache/faqs"
+
+# Cheap pre-filter, pages without any question-like content never reach the LLM
+MIN_FAQ_TEXT_CHARS = 500
+_FAQ_HINT_RE = re.compile(r"\b(faq|how|what|why|when|does|can)\b", re.IGNORECASE)
+
+# Horizontal whitespace runs in extracted page text, collapsed before the LLM sees it
+_WHITESPACE_RE = re.compile(r"[ \t\r\f\v]+")
+
+# Public suffix list bundled with tldextract, never fetched over the network
+_TLD = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
 
 class URLInput(BaseModel):
     url: str
@@ -241,115 +294,396 @@ class URLInput(BaseModel):
 def is_valid_url(url):
     return url.startswith("http")
 
+@functools.lru_cache(maxsize=200_000)
 def get_domain(url):
-    ext = tldextract.extract(url)
+    ext = _TLD(url)
     return f"{ext.domain}.{ext.suffix}"
 
-def crawl_site(url, base_domain):
-    to_visit = [url]
-    visited = set()
+def normalize_url(url, collapse_trailing_slash=False):
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    path = parsed.path
+    # "/docs" and "/docs/" resolve relative links differently, so only collapse them when comparing fetched pages
+    if collapse_trailing_slash:
+        path = path.rstrip("/") or "/"
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), path, parsed.params, query, ""))
+
+def dedupe_pages(pages):
+    seen_urls = set()
+    seen_texts = set()
+    unique_pages = []
+
+    for page_url, text in pages:
+        url_key = normalize_url(page_url, collapse_trailing_slash=True)
+        text_key = hashlib.sha256(text.encode()).digest()
+        if url_key in seen_urls or text_key in seen_texts:
+            continue
+        seen_urls.add(url_key)
+        seen_texts.add(text_key)
+        unique_pages.append((page_url, text))
+
+    return unique_pages
+
+def looks_faqish(text):
+    return len(text) >= MIN_FAQ_TEXT_CHARS and ("?" in text or _FAQ_HINT_RE.search(text) is not None)
+
+def _parse(html):
+    soup = BeautifulSoup(html, "lxml")
+    hrefs = [a_tag["href"] for a_tag in soup.find_all("a", href=True)]
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+    text = soup.get_text(separator="\n", strip=True)
+    text = _WHITESPACE_RE.sub(" ", text)
+    return text, hrefs
+
+async def fetch(session, sem, url):
+    async with sem:
+        for attempt in range(CRAWL_RETRIES + 1):
+            try:
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        return url, None, []
+                    html = await response.text()
+                    # Relative links resolve against where redirects actually landed
+                    final_url = str(response.url)
+                break
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == CRAWL_RETRIES:
+                    logger.warning(f"❌ Error visiting {url}: {e}")
+                    return url, None, []
+                await asyncio.sleep(CRAWL_BACKOFF_SECONDS * 2 ** attempt)
+            except Exception as e:
+                logger.warning(f"❌ Error visiting {url}: {e}")
+                return url, None, []
+
+    # Parsing is CPU-bound, keep it off the event loop so other fetches keep flowing
+    try:
+        text, hrefs = await asyncio.to_thread(_parse, html)
+    except Exception as e:
+        logger.warning(f"❌ Error parsing {url}: {e}")
+        return url, None, []
+
+    return final_url, text, hrefs
+
+async def crawl_site(url, base_domain):
+    to_visit = deque([url])
+    seen = {normalize_url(url)}  # Normalized form of every URL ever enqueued
     html_pages = []
     logger.info(f"🌐 Starting crawl at: {url}")
 
     parsed_root = urlparse(url)
     base_path = parsed_root.path.rstrip("/") + "/"  # Ensure trailing slash
+    # Links under the start URL on the same host match one of these without any URL parsing
+    scope_prefixes = tuple(
+        f"{scheme}://{parsed_root.netloc.lower()}{base_path}" for scheme in ("http", "https")
+    )
 
-    while to_visit:
-        current_url = to_visit.pop(0)
-        if current_url in visited:
-            continue
-        visited.add(current_url)
+    sem = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=10)
+    timeout = aiohttp.ClientTimeout(total=10)
 
-        try:
-            response = requests.get(current_url, timeout=10)
-            if response.status_code != 200:
-                continue
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Breadth-first, one frontier wave at a time: every URL in the wave is fetched concurrently
+        while to_visit:
+            wave = [to_visit.popleft() for _ in range(len(to_visit))]
 
-            soup = BeautifulSoup(response.text, "html.parser")
-            text = soup.get_text(separator="\n", strip=True)
-            html_pages.append((current_url, text))
+            results = await asyncio.gather(*(fetch(session, sem, u) for u in wave))
 
-            logger.info(f"✅ Scraped: {current_url}")
+            for current_url, text, hrefs in results:
+                if text is None:
+                    continue
 
-            for a_tag in soup.find_all("a", href=True):
-                href = a_tag["href"]
-                absolute_url = urljoin(current_url, href)
-                parsed_url = urlparse(absolute_url)
+                seen.add(normalize_url(current_url))  # Redirect targets count as fetched too
+                html_pages.append((current_url, text))
+                logger.info(f"✅ Scraped: {current_url}")
 
-                if (
-                    is_valid_url(absolute_url)
-                    and get_domain(absolute_url) == base_domain
-                    and absolute_url not in visited
-                    and absolute_url not in to_visit
-                    and parsed_url.path.startswith(base_path)
-                ):
-                    to_visit.append(absolute_url)
+                for href in hrefs:
+                    absolute_url, _ = urldefrag(urljoin(current_url, href))
+                    if absolute_url.split("?", 1)[0].lower().endswith(SKIPPED_EXTENSIONS):
+                        continue
 
-        except Exception as e:
-            logger.warning(f"❌ Error visiting {current_url}: {e}")
-            continue
+                    if not absolute_url.startswith(scope_prefixes) and not (
+                        is_valid_url(absolute_url)
+                        and get_domain(absolute_url) == base_domain
+                        and urlparse(absolute_url).path.startswith(base_path)
+                    ):
+                        continue
+
+                    url_key = normalize_url(absolute_url)
+                    if url_key not in seen:
+                        seen.add(url_key)
+                        to_visit.append(absolute_url)
 
     return html_pages
 
-def extract_faqs_from_text(text, page_url):
+# Structured Outputs schema, the model returns exactly this shape
+FAQ_SCHEMA = {
+    "name": "faqs",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "faqs": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question": {"type": "string"},
+                        "answer": {"type": "string"},
+                    },
+                    "required": ["question", "answer"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["faqs"],
+        "additionalProperties": False,
+    },
+}
+
+# tiktoken downloads its BPE file on first use (set TIKTOKEN_CACHE_DIR to ship it with the image).
+# If it cannot be loaded, prompts fall back to a character cut instead of failing the job.
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    try:
+        try:
+            return tiktoken.encoding_for_model(OPENAI_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken encoding unavailable, truncating prompts by characters: {e}")
+        return None
+
+def truncate_for_prompt(text):
+    # ~8 characters per token is a generous upper bound for page text, no point encoding past it
+    text = text[:MAX_PROMPT_TOKENS * 8]
+    enc = get_encoding()
+    if enc is None:
+        return text[:MAX_PROMPT_TOKENS * 4]
+    return enc.decode(enc.encode(text, disallowed_special=())[:MAX_PROMPT_TOKENS])
+
+def build_faq_request(text, page_url):
     prompt = (
-        "Extract 5 to 10 frequently asked questions (FAQs) from the following web page content. "
-        "Format the result strictly as a CSV file with the header: question,answer. "
-        "Escape commas and quotes properly using standard CSV rules. Do NOT use markdown.\n\n"
+        "Extract 3 to 8 frequently asked questions (FAQs) from the following web page content. "
+        "Keep each answer under 50 words.\n\n"
         f"Page URL: {page_url}\n\n"
-        f"Content:\n{text[:8000]}"
+        f"Content:\n{text}"
     )
 
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": "You extract FAQs from web pages."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.4,
+        "max_tokens": MAX_COMPLETION_TOKENS,
+        "response_format": {"type": "json_schema", "json_schema": FAQ_SCHEMA},
+    }
+
+async def extract_faqs_from_text(text, page_url, sem):
+    async with sem:
+        logger.info(f"📝 Processing page: {page_url}")
+        try:
+            stream = await client.chat.completions.create(**build_faq_request(text, page_url), stream=True)
+            chunks = []
+            finish_reason = None
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                if chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+        except Exception as e:
+            logger.error(f"❌ OpenAI API Error for {page_url}: {e}")
+            return None
+
+    # A response cut off at max_tokens is truncated JSON, not something to parse
+    if finish_reason == "length":
+        logger.error(f"❌ OpenAI response truncated at the token limit for {page_url}")
+        return None
+
+    return "".join(chunks)
+
+async def call_batch_api(batch_id, action, make_call):
+    # The client has already retried these; keep waiting rather than abandon a running batch
+    while True:
+        try:
+            return await make_call()
+        except BATCH_TRANSIENT_ERRORS as e:
+            logger.warning(f"⚠️ {action} OpenAI batch {batch_id} failed, retrying: {e}")
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+
+async def extract_faqs_batch(pages):
+    lines = [
+        json.dumps({
+            "custom_id": page_url,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_faq_request(text, page_url),
+        })
+        for page_url, text in pages
+    ]
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You extract FAQs in CSV format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4
+        batch_file = await client.files.create(
+            file=("faq_batch.jsonl", "\n".join(lines).encode()),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        logger.error(f"❌ OpenAI API Error for {page_url}: {e}")
-        return None
+        logger.error(f"❌ OpenAI Batch API Error: {e}")
+        return {}
+
+    batch_id = batch.id
+    logger.info(f"📤 Submitted OpenAI batch {batch_id} for {len(pages)} pages")
 
-def safe_parse_csv(raw_csv: str):
+    # From here on the batch is running and paid for: ride out transient errors instead of dropping it
     try:
-        raw_csv = raw_csv.strip()
-        if raw_csv.startswith("```"):
-            raw_csv = raw_csv.strip("`").split("csv")[-1].strip()
+        while batch.status not in BATCH_FINAL_STATUSES:
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+            batch = await call_batch_api(batch_id, "Polling", lambda: client.batches.retrieve(batch_id))
 
-        lines = raw_csv.splitlines()
-        if not lines or "question" not in lines[0].lower() or "answer" not in lines[0].lower():
-            logger.warning("⚠️ Missing or incorrect headers, attempting to fix...")
-            lines.insert(0, "question,answer")
+        if not batch.output_file_id:
+            logger.error(f"❌ OpenAI batch {batch_id} finished as {batch.status} with no output")
+            return {}
 
-        cleaned_lines = [line for line in lines if ',' in line]
-        reader = csv.DictReader(cleaned_lines)
-        faqs = list(reader)
+        output_file_id = batch.output_file_id
+        output = await call_batch_api(
+            batch_id, "Downloading output", lambda: client.files.content(output_file_id)
+        )
+    except Exception as e:
+        logger.error(f"❌ OpenAI Batch API Error for batch {batch_id} (results can be fetched manually): {e}")
+        return {}
 
-        if not faqs or "question" not in faqs[0] or "answer" not in faqs[0]:
-            raise ValueError("Parsed CSV is invalid")
+    logger.info(f"📥 OpenAI batch {batch_id} finished as {batch.status}")
 
-        return faqs
+    results = {}
+    for line in output.text.splitlines():
+        # One bad line must not throw away every other already-paid result in the batch
+        try:
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.error(f"❌ OpenAI API Error for {custom_id}: {record.get('error')}")
+                continue
+            choice = response["body"]["choices"][0]
+            if choice.get("finish_reason") == "length":
+                logger.error(f"❌ OpenAI response truncated at the token limit for {custom_id}")
+                continue
+            results[custom_id] = choice["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            logger.error(f"❌ Skipping malformed OpenAI batch output line: {e!r}")
+            continue
+
+    return results
+
+@functools.lru_cache(maxsize=None)
+def get_gcs_client():
+    if gcs_credentials:
+        return storage.Client(credentials=gcs_credentials, project=gcs_credentials.project_id)
+    return storage.Client()
+
+def faq_cache_key(text):
+    # Hash the whole request shape (model, prompt, schema, sampling, limits) minus the page URL,
+    # so any change to how FAQs are requested invalidates old entries
+    request = build_faq_request(text, page_url="")
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+def read_faq_cache(bucket, key):
+    try:
+        return bucket.blob(f"{FAQ_CACHE_PREFIX}/{key}.json").download_as_text()
+    except NotFound:
+        return None
     except Exception as e:
-        logger.error(f"❌ Failed to parse CSV: {e}")
-        return []
+        logger.warning(f"⚠️ FAQ cache read failed for {key}: {e}")
+        return None
+
+def write_faq_cache(bucket, key, faqs_json):
+    try:
+        bucket.blob(f"{FAQ_CACHE_PREFIX}/{key}.json").upload_from_string(
+            faqs_json, content_type="application/json"
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ FAQ cache write failed for {key}: {e}")
+
+def parse_faqs(raw_json: str):
+    # None means the response was unusable, [] means the page simply has no FAQs
+    try:
+        return json.loads(raw_json)["faqs"]
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"❌ Failed to parse FAQs: {e}")
+        return None
+
+async def extract_all_faqs(pages, bucket):
+    texts = await asyncio.gather(*(asyncio.to_thread(truncate_for_prompt, text) for _, text in pages))
+    pages = [(page_url, text) for (page_url, _), text in zip(pages, texts)]
+    keys = {page_url: faq_cache_key(text) for page_url, text in pages}
+    hits = await asyncio.gather(
+        *(asyncio.to_thread(read_faq_cache, bucket, keys[page_url]) for page_url, _ in pages)
+    )
+    cached = {page_url: hit for (page_url, _), hit in zip(pages, hits) if hit}
+    misses = [(page_url, text) for page_url, text in pages if page_url not in cached]
+    logger.info(f"🗃️ FAQ cache hits: {len(cached)}/{len(pages)}")
+
+    fresh = {}
+    if misses and USE_BATCH_API:
+        fresh = await extract_faqs_batch(misses)
+    elif misses:
+        sem = asyncio.Semaphore(LLM_CONCURRENCY)
+        results = await asyncio.gather(
+            *(extract_faqs_from_text(text, page_url, sem) for page_url, text in misses)
+        )
+        fresh = {page_url: faqs_json for (page_url, _), faqs_json in zip(misses, results)}
+
+    all_faqs = []
+    cache_writes = []
+
+    for page_url, _ in pages:
+        if page_url in cached:
+            all_faqs.extend(parse_faqs(cached[page_url]) or [])
+        elif fresh.get(page_url):
+            faqs = parse_faqs(fresh[page_url])
+            if faqs is None:
+                continue
+            # Empty results are cached too, so non-FAQ pages are not re-sent on every re-crawl
+            cache_writes.append(
+                asyncio.to_thread(write_faq_cache, bucket, keys[page_url], fresh[page_url])
+            )
+            all_faqs.extend(faqs)
+
+    await asyncio.gather(*cache_writes)
+    return all_faqs
 
-def upload_to_gcs(bucket_name: str, destination_blob_name: str, source_data: str):
+def upload_to_gcs(bucket_name: str, destination_blob_name: str, rows: list):
     try:
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        bucket = get_gcs_client().bucket(bucket_name)
         blob = bucket.blob(destination_blob_name)
-        blob.upload_from_string(source_data, content_type='text/csv')
+        # Rows are written straight into the resumable upload stream, no in-memory copy of the file.
+        # Binary mode keeps BlobWriter's own __exit__ in charge: it finalizes on success and
+        # terminates the upload on error, so a failed write never replaces the existing CSV.
+        # ignore_flush lets the text wrapper flush on detach without forcing a finalize.
+        with blob.open("wb", content_type='text/csv', ignore_flush=True) as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            try:
+                writer = csv.DictWriter(f, fieldnames=["question", "answer"], restval="", extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(rows)
+            finally:
+                f.detach()
         logger.info(f"📦 CSV uploaded to GCS: gs://{bucket_name}/{destination_blob_name}")
         return f"gs://{bucket_name}/{destination_blob_name}"
     except Exception as e:
         logger.error(f"❌ Failed to upload to GCS: {e}")
         raise HTTPException(status_code=500, detail="GCS upload failed.")
 
-def scrape_and_generate_faqs_task(url: str):
+async def scrape_and_generate_faqs_task(url: str):
     logger.info(f"📅 Background scrape started for URL: {url}")
 
     if not is_valid_url(url):
@@ -357,49 +691,65 @@ def scrape_and_generate_faqs_task(url: str):
         return
 
     base_domain = get_domain(url)
-    pages = crawl_site(url, base_domain)
+    pages = await crawl_site(url, base_domain)
 
     if not pages:
         logger.error("❌ No pages found during crawl")
         return
 
-    all_faqs = []
+    unique_pages = dedupe_pages(pages)
+    logger.info(f"🧹 Skipping {len(pages) - len(unique_pages)} duplicate pages")
+    pages = [(page_url, text) for page_url, text in unique_pages if looks_faqish(text)]
+    logger.info(f"🧹 Skipping {len(unique_pages) - len(pages)} pages with no FAQ-like content")
 
-    for page_url, text in pages:
-        logger.info(f"📝 Processing page: {page_url}")
-        csv_text = extract_faqs_from_text(text, page_url)
-        if csv_text:
-            faqs = safe_parse_csv(csv_text)
-            all_faqs.extend(faqs)
+    if not pages:
+        logger.error("❌ No pages with FAQ-like content")
+        return
+
+    bucket_name = os.getenv("GCS_BUCKET_NAME")
+    gcs_client = await asyncio.to_thread(get_gcs_client)
+    all_faqs = await extract_all_faqs(pages, gcs_client.bucket(bucket_name))
 
     if not all_faqs:
         logger.error("❌ No FAQs extracted")
         return
 
-    csv_buffer = io.StringIO()
-    writer = csv.DictWriter(csv_buffer, fieldnames=["question", "answer"])
-    writer.writeheader()
-    fieldnames = ["question", "answer"]  # Or whatever you used
-    cleaned_faqs = [
-        {key: row.get(key, "") for key in fieldnames}
-        for row in all_faqs
-    ]
-    writer.writerows(cleaned_faqs)
+    await asyncio.to_thread(upload_to_gcs, bucket_name, "faq/faq_scraped.csv", all_faqs)
 
+async def worker_startup(ctx):
+    # Load the tokenizer before the first job so its download never lands mid-scrape
+    await asyncio.to_thread(get_encoding)
 
-    bucket_name = os.getenv("GCS_BUCKET_NAME")
-    upload_to_gcs(bucket_name, "faq/faq_scraped.csv", csv_buffer.getvalue())
+async def scrape_job(ctx, url: str):
+    await scrape_and_generate_faqs_task(url)
+
+# Run the worker alongside the API with: arq main.WorkerSettings
+class WorkerSettings:
+    functions = [scrape_job]
+    on_startup = worker_startup
+    redis_settings = REDIS_SETTINGS
+    max_jobs = 4
+    # Batch API jobs poll until OpenAI finishes, which can take up to the 24h completion window
+    job_timeout = 24 * 60 * 60 if USE_BATCH_API else 60 * 60
 
 @app.post("/scrape")
-def scrape_endpoint(input_data: URLInput, background_tasks: BackgroundTasks):
-    background_tasks.add_task(scrape_and_generate_faqs_task, input_data.url)
-    return {"message": "✅ Scraping started in background."}
+async def scrape_endpoint(input_data: URLInput):
+    job = await app.state.redis.enqueue_job("scrape_job", input_data.url)
+    return {"message": "✅ Scraping queued.", "job_id": job.job_id}
 
 @app.get("/")
-def health_check():
+async def health_check():
     return {"status": "OK"}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "4")),
+    )
 